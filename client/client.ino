@@ -44,6 +44,7 @@ HTTPClient http;
 PNG png;
 WiFiUDP udp;
 NTPClient timeClient(udp, NTP_SERVER, 0, NTP_SYNC_INTERVAL_MS);
+String lastImageEtag = "";
 int lastSuccessfulRefreshHour = -1;
 uint8_t* png_buffer = nullptr;
 uint16_t png_callback_rgb565_buffer[SCREEN_WIDTH];
@@ -95,6 +96,7 @@ void displayTextMessage(const String& message) {
   int fontHeight = 16;
   int lineStart = 0;
   int yPos = TEXT_MARGIN_Y;
+  lastImageEtag = "";
   epaper.fillScreen(0xf);
   epaper.setFont(FONT_12x16);
   epaper.setTextColor(0x0);
@@ -156,11 +158,21 @@ void pngDrawCallback(PNGDRAW* pDraw) {
 
 bool updateDashboardImage() {
   Serial.println("Fetching image...");
+  const char* headerKeys[] = { "ETag" };
   http.begin(SERVER_URL);
+  http.collectHeaders(headerKeys, 1);
+
+  if (lastImageEtag.length() > 0) {
+    http.addHeader("If-None-Match", lastImageEtag);
+  }
+
   int httpCode = http.GET();
   bool success = false;
 
-  if (httpCode == HTTP_CODE_OK) {
+  if (httpCode == HTTP_CODE_NOT_MODIFIED) {
+    Serial.println("Image unchanged (304). Keeping current screen.");
+    success = true;
+  } else if (httpCode == HTTP_CODE_OK) {
     int len = http.getSize();
 
     if (len <= 0) {
@@ -205,6 +217,7 @@ bool updateDashboardImage() {
                 Serial.println("Updating screen with image...");
                 epaper.fullUpdate(true);
                 Serial.println("Screen update complete.");
+                lastImageEtag = http.header("ETag");
                 success = true;
               } else {
                 Serial.printf("Error: PNG decode failed (Code: %d).\n", rc);
@@ -5,6 +5,8 @@
 #     "flask",
 #     "gunicorn",
 #     "icalendar",
+#     "orjson",
+#     "pillow",
 #     "playwright",
 #     "python-dotenv",
 #     "requests",
@@ -12,39 +14,93 @@
 # ]
 # ///
 
+import atexit
+import base64
 import datetime
+import functools
+import hashlib
+import hmac
+import io
 import json
+import logging
 import os
+import queue
+import random
+import tempfile
 import threading
 import time
-import traceback
+import types
 import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from logging.handlers import QueueHandler, QueueListener
+from operator import itemgetter
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 import caldav
 import requests
 from dotenv import load_dotenv
-from flask import Flask, abort, render_template, Response
+from flask import Flask, abort, request, Response
 from icalendar import Calendar
-from playwright.sync_api import sync_playwright, Error as PlaywrightError
+from jinja2 import FileSystemBytecodeCache
+from PIL import Image
+from playwright.sync_api import sync_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ==============================================================================
+# Logging
+# ==============================================================================
+LOG_QUEUE = queue.SimpleQueue()
+LOG_HANDLER = logging.StreamHandler()
+LOG_HANDLER.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+LOG_LISTENER = QueueListener(LOG_QUEUE, LOG_HANDLER)
+LOG_LISTENER.start()
+atexit.register(LOG_LISTENER.stop)
+LOGGER = logging.getLogger("dailydisplay")
+LOGGER.addHandler(QueueHandler(LOG_QUEUE))
+LOGGER.propagate = False
 
 # ==============================================================================
 # Load Environment Variables
 # ==============================================================================
 load_dotenv()
-print("Attempted to load configuration from .env file (if present).")
+ENV = dict(os.environ)
+LOGGER.setLevel(logging.DEBUG if ENV.get("DAILY_DEBUG") == "1" else logging.INFO)
+LOGGER.info("Attempted to load configuration from .env file (if present).")
 
 # ==============================================================================
 # Configuration Constants
 # ==============================================================================
+ADMIN_TOKEN = ENV.get("DAILY_ADMIN_TOKEN")
 API_OPEN_METEO_FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
 API_OPEN_METEO_GEOCODE_URL = "https://geocoding-api.open-meteo.com/v1/search"
 
+APP_SNAPSHOT_MAX_AGE_SECONDS = 2 * 60 * 60
+APP_SNAPSHOT_PATH = os.path.join(tempfile.gettempdir(), "dailydisplay_snapshot.json")
+FETCH_CALDAV_BUDGET_SECONDS = 60
+FETCH_CALDAV_MAX_WORKERS = 8
 FETCH_CALDAV_TIMEOUT = 30
 FETCH_WEATHER_TIMEOUT = 15
+GEOCODE_CACHE_PATH = os.path.join(tempfile.gettempdir(), "dailydisplay_geocode.json")
+GEOCODE_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
 HTML_PAGE_REFRESH_SECONDS = 60
+ICS_PARSE_CACHE_SIZE = 4096
+ONE_DAY = datetime.timedelta(days=1)
+REFRESH_MAX_WORKERS = 8
+REFRESH_RETRY_MAX_SECONDS = 600
+REFRESH_TRIGGER_MIN_SECONDS = 60
 TARGET_REFRESH_MINUTE = 58
 
+PNG_CACHE_CONTROL = "public, max-age=60"
+PNG_GRAY_LEVELS = 16
+PNG_RENDER_MAX_WORKERS = min(4, os.cpu_count() or 1)
 PNG_TIMEOUT = 30000
 PNG_VIEWPORT_HEIGHT = 540
 PNG_VIEWPORT_WIDTH = 960
@@ -109,34 +165,72 @@ WEATHER_ICON_CLASS_MAP_NIGHT = {
     99: "wi-storm-showers",
     "unknown": "wi-na",
 }
+WEATHER_ICON_CLASSES_DAY = tuple(WEATHER_ICON_CLASS_MAP_DAY.get(code, WEATHER_ICON_CLASS_MAP_DAY["unknown"]) for code in range(100))
+WEATHER_ICON_CLASSES_NIGHT = tuple(WEATHER_ICON_CLASS_MAP_NIGHT.get(code, WEATHER_ICON_CLASSES_DAY[code]) for code in range(100))
 
 # ==============================================================================
 # Global State & App Initialization
 # ==============================================================================
 app = Flask(__name__)
-APP_DATA = {}
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+APP_DATA = types.MappingProxyType({})
 APP_DATA_LOCK = threading.Lock()
+FORECAST_CACHE = {}
+FORECAST_CACHE_LOCK = threading.Lock()
+GEOCODE_CACHE = {}
+GEOCODE_CACHE_LOCK = threading.Lock()
+HTML_RENDER_CACHE = {}
+HTML_RENDER_CACHE_LOCK = threading.Lock()
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504), respect_retry_after_header=False)))
+ICS_PARSE_CACHE = OrderedDict()
+ICS_PARSE_CACHE_LOCK = threading.Lock()
+INDEX_TEMPLATE = app.jinja_env.get_template("index.html")
+INFLIGHT_CALLS = {}
+INFLIGHT_CALLS_LOCK = threading.Lock()
+LAST_REFRESH_MONOTONIC = 0.0
 PNG_CACHE = {}
 PNG_CACHE_LOCK = threading.Lock()
+PNG_GRAY_PALETTE = Image.new("P", (1, 1))
+PNG_GRAY_PALETTE.putpalette([level * 255 // (PNG_GRAY_LEVELS - 1) for level in range(PNG_GRAY_LEVELS) for _ in range(3)])
+PNG_RENDER_EXECUTOR = ThreadPoolExecutor(max_workers=PNG_RENDER_MAX_WORKERS, thread_name_prefix="PNGRender")
+PNG_RENDER_STATE = threading.local()
+PNG_VIEWPORT_SIZE = {"height": PNG_VIEWPORT_HEIGHT, "width": PNG_VIEWPORT_WIDTH}
+REFRESH_IN_PROGRESS = threading.Event()
+REFRESH_TRIGGER = threading.Event()
+RENDER_FINGERPRINTS = {}
+SHUTDOWN_EVENT = threading.Event()
+TEMPLATE_CONTEXT_CACHE = {}
+TEMPLATE_CONTEXT_CACHE_LOCK = threading.Lock()
+
 
 # ==============================================================================
 # User Configuration Loading
 # ==============================================================================
+@dataclass(frozen=True, slots=True)
+class UserConfig:
+    caldav_filters: frozenset | None
+    caldav_urls: tuple
+    timezone: str
+    timezone_obj: ZoneInfo
+    weather_location: str
+
+
 USER_CONFIG = {}
 try:
-    config_json_str = os.environ.get("CONFIG")
+    config_json_str = ENV.get("CONFIG")
     if not config_json_str:
-        print("Warning: CONFIG environment variable not set or empty.")
+        LOGGER.warning("CONFIG environment variable not set or empty.")
     else:
-        print("Loading configuration from CONFIG environment variable (JSON)...")
-        config_data = json.loads(config_json_str)
+        LOGGER.info("Loading configuration from CONFIG environment variable (JSON)...")
+        config_data = orjson.loads(config_json_str) if orjson else json.loads(config_json_str)
         if not isinstance(config_data, dict):
             raise ValueError("CONFIG JSON must be a dictionary")
 
         for user_hash, user_settings in config_data.items():
             user_hash = user_hash.strip()
             if not user_hash or not isinstance(user_settings, dict):
-                print(f"  Warning: Skipping invalid entry: {user_hash}")
+                LOGGER.warning("Skipping invalid entry: %s", user_hash)
                 continue
             try:
                 tz_str = user_settings["timezone"]
@@ -144,45 +238,172 @@ try:
                 user_tz = ZoneInfo(tz_str)
                 caldav_urls_str = user_settings.get("caldav_urls", "")
                 caldav_filter_str = user_settings.get("caldav_filter_names")
-                caldav_urls = [url.strip() for url in caldav_urls_str.split(",") if url.strip()]
-                caldav_filters = {name.strip().lower() for name in caldav_filter_str.split(",")} if caldav_filter_str else None
-                USER_CONFIG[user_hash] = {
-                    "caldav_filters": caldav_filters,
-                    "caldav_urls": caldav_urls,
-                    "timezone": tz_str,
-                    "timezone_obj": user_tz,
-                    "weather_location": weather_loc,
-                }
-                print(f"Loaded config for user '{user_hash}'")
+                caldav_urls = tuple(url.strip() for url in caldav_urls_str.split(",") if url.strip())
+                caldav_filters = frozenset(name.strip().lower() for name in caldav_filter_str.split(",")) if caldav_filter_str else None
+                USER_CONFIG[user_hash] = UserConfig(caldav_filters=caldav_filters, caldav_urls=caldav_urls, timezone=tz_str, timezone_obj=user_tz, weather_location=weather_loc)
+                LOGGER.info("Loaded config for user '%s'", user_hash)
             except (KeyError, ValueError, ZoneInfoNotFoundError) as e:
-                print(f"  Configuration Error for user '{user_hash}': {e}. Skipping.")
-            except Exception as e:
-                print(f"  Unexpected error loading configuration for user '{user_hash}': {e}")
-                traceback.print_exc()
-                print(f"  Skipping user '{user_hash}'.")
+                LOGGER.warning("Configuration Error for user '%s': %s. Skipping.", user_hash, e)
+            except Exception:
+                LOGGER.exception("Unexpected error loading configuration for user '%s'. Skipping.", user_hash)
 except (json.JSONDecodeError, ValueError) as e:
-    print(f"Configuration Error: Invalid JSON or structure in CONFIG: {e}")
+    LOGGER.error("Configuration Error: Invalid JSON or structure in CONFIG: %s", e)
     raise RuntimeError("Failed to parse JSON configuration") from e
 except Exception as e:
-    print(f"Fatal error during configuration loading: {e}")
-    traceback.print_exc()
+    LOGGER.exception("Fatal error during configuration loading")
     raise RuntimeError("Failed to load user configuration") from e
 if not USER_CONFIG:
-    print("Warning: No valid user configurations loaded.")
+    LOGGER.warning("No valid user configurations loaded.")
+USER_CONFIG = types.MappingProxyType(USER_CONFIG)
+USER_HASHES = frozenset(USER_CONFIG)
 
 
 # ==============================================================================
 # Helper Function Definitions (Alphabetically Sorted)
 # ==============================================================================
+def _apply_caldav_budget(client, url_deadline):
+    remaining_seconds = url_deadline - time.monotonic()
+    if remaining_seconds <= 0:
+        return False
+    client.timeout = min(FETCH_CALDAV_TIMEOUT, remaining_seconds)
+    return True
+
+
 def _build_template_context(user_hash, user_data):
     user_tz = user_data["timezone_obj"]
     now_user_tz = datetime.datetime.now(user_tz)
     last_updated_ts = user_data.get("last_updated", 0)
-    last_updated_dt = datetime.datetime.fromtimestamp(last_updated_ts, tz=datetime.UTC).astimezone(user_tz)
-    today_date_header_str = now_user_tz.strftime("%a, %b %d")
-    tomorrow_date_obj = now_user_tz + datetime.timedelta(days=1)
-    tomorrow_date_header_str = tomorrow_date_obj.strftime("%a, %b %d")
-    return {"user_hash": user_hash, "current_date_str": now_user_tz.strftime("%a, %d %b"), "last_updated_str": last_updated_dt.strftime("%Y-%m-%d %H:%M:%S %Z"), "now_local": now_user_tz, "refresh_interval": HTML_PAGE_REFRESH_SECONDS, "today_events": user_data.get("today_events", []), "tomorrow_events": user_data.get("tomorrow_events", []), "weather_info": user_data.get("weather", {}), "today_date_header_str": today_date_header_str, "tomorrow_date_header_str": tomorrow_date_header_str}
+    context_key = (last_updated_ts, now_user_tz.date())
+    with TEMPLATE_CONTEXT_CACHE_LOCK:
+        cached_context = TEMPLATE_CONTEXT_CACHE.get(user_hash)
+    if cached_context is None or cached_context[0] != context_key:
+        today_date_header_str = now_user_tz.strftime("%a, %b %d")
+        tomorrow_date_obj = now_user_tz + ONE_DAY
+        tomorrow_date_header_str = tomorrow_date_obj.strftime("%a, %b %d")
+        cached_context = (context_key, {"user_hash": user_hash, "current_date_str": now_user_tz.strftime("%a, %d %b"), "last_updated_str": user_data.get("last_updated_str", ""), "refresh_interval": HTML_PAGE_REFRESH_SECONDS, "today_events": user_data.get("today_events", []), "tomorrow_events": user_data.get("tomorrow_events", []), "weather_info": user_data.get("weather", {}), "today_date_header_str": today_date_header_str, "tomorrow_date_header_str": tomorrow_date_header_str})
+        with TEMPLATE_CONTEXT_CACHE_LOCK:
+            TEMPLATE_CONTEXT_CACHE[user_hash] = cached_context
+    return {**cached_context[1], "now_local": now_user_tz}
+
+
+def _cached_lat_lon(location_name, session):
+    cache_key = location_name.strip().lower()
+    with GEOCODE_CACHE_LOCK:
+        cached_coords = GEOCODE_CACHE.get(cache_key)
+    if not isinstance(cached_coords, (list, tuple)) or len(cached_coords) != 3 or not all(isinstance(value, (int, float)) for value in cached_coords):
+        cached_coords = None
+    if cached_coords and time.time() - cached_coords[2] < GEOCODE_CACHE_TTL_SECONDS:
+        return cached_coords[0], cached_coords[1]
+    lat, lon = _fetch_lat_lon(location_name, session)
+    if lat is not None and lon is not None:
+        with GEOCODE_CACHE_LOCK:
+            GEOCODE_CACHE[cache_key] = [lat, lon, time.time()]
+            _save_geocode_cache()
+    elif cached_coords:
+        LOGGER.warning("Geocoding refresh failed for '%s', using expired cached coordinates.", location_name)
+        return cached_coords[0], cached_coords[1]
+    return lat, lon
+
+
+def _call_shared(inflight_key, func, *args):
+    # Concurrent callers with the same key wait on one in-flight call, so users sharing a CalDAV server or weather location fetch it once per cycle.
+    with INFLIGHT_CALLS_LOCK:
+        future = INFLIGHT_CALLS.get(inflight_key)
+        is_owner = future is None
+        if is_owner:
+            future = INFLIGHT_CALLS[inflight_key] = Future()
+    if not is_owner:
+        return future.result()
+    try:
+        result = func(*args)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with INFLIGHT_CALLS_LOCK:
+            INFLIGHT_CALLS.pop(inflight_key, None)
+
+
+def _close_png_renderer():
+    for attr in ("page", "context", "browser"):
+        resource = getattr(PNG_RENDER_STATE, attr, None)
+        setattr(PNG_RENDER_STATE, attr, None)
+        if resource:
+            try:
+                resource.close()
+            except PlaywrightError as e:
+                LOGGER.warning("Error closing Playwright %s: %s", attr, e)
+    playwright_instance = getattr(PNG_RENDER_STATE, "playwright", None)
+    PNG_RENDER_STATE.playwright = None
+    if playwright_instance:
+        try:
+            playwright_instance.stop()
+        except Exception as e:
+            LOGGER.warning("Error stopping Playwright: %s", e)
+
+
+def _convert_png_for_eink(png_bytes):
+    with Image.open(io.BytesIO(png_bytes)) as screenshot:
+        gray_image = screenshot.convert("RGB").quantize(palette=PNG_GRAY_PALETTE, dither=Image.Dither.NONE)
+    output = io.BytesIO()
+    gray_image.save(output, format="PNG", bits=4, optimize=True)
+    return output.getvalue()
+
+
+@functools.lru_cache(maxsize=64)
+def _day_bounds(user_tz, local_date):
+    today_start = datetime.datetime.combine(local_date, datetime.time.min, tzinfo=user_tz)
+    today_end = today_start + ONE_DAY
+    return today_start, today_end, today_end, today_end + ONE_DAY
+
+
+def _fetch_caldav_events(url, caldav_filters, periods, user_tz):
+    events, errors = [], []
+    today_start = periods[0][1]
+    url_deadline = time.monotonic() + FETCH_CALDAV_BUDGET_SECONDS
+    username, password, url_display_name = None, None, url
+    try:
+        parsed_url = urllib.parse.urlparse(url)
+        url_display_name = parsed_url.hostname if parsed_url.hostname else url
+        username = urllib.parse.unquote(parsed_url.username) if parsed_url.username else None
+        password = urllib.parse.unquote(parsed_url.password) if parsed_url.password else None
+        url_no_creds = parsed_url._replace(netloc=parsed_url.hostname + (f":{parsed_url.port}" if parsed_url.port else "")).geturl()
+        with caldav.DAVClient(url=url_no_creds, username=username, password=password, timeout=FETCH_CALDAV_TIMEOUT) as client:
+            principal = client.principal()
+            if not _apply_caldav_budget(client, url_deadline):
+                raise requests.exceptions.Timeout(f"CalDAV budget of {FETCH_CALDAV_BUDGET_SECONDS}s exhausted")
+            calendars = principal.calendars()
+            if not calendars:
+                LOGGER.info("No calendars found for principal at %s.", url_display_name)
+                return events, errors
+            calendars_to_search = []
+            for calendar_obj in calendars:
+                try:
+                    calendar_name = getattr(calendar_obj, "name", "Unknown Calendar") or "Unknown Calendar"
+                except Exception as cal_name_ex:
+                    calendar_name = f"Unknown(NameErr: {cal_name_ex})"
+                if caldav_filters and calendar_name.lower() not in caldav_filters:
+                    continue
+                calendars_to_search.append((calendar_obj, calendar_name))
+            if not calendars_to_search:
+                return events, errors
+            with ThreadPoolExecutor(max_workers=min(len(calendars_to_search), FETCH_CALDAV_MAX_WORKERS), thread_name_prefix="CalDAVSearch") as executor:
+                futures = [executor.submit(_search_calendar, calendar_obj, calendar_name, periods, user_tz, url_deadline) for calendar_obj, calendar_name in calendars_to_search]
+                for future in futures:
+                    calendar_events, calendar_errors = future.result()
+                    events.extend(calendar_events)
+                    errors.extend(calendar_errors)
+    except (caldav.lib.error.AuthorizationError, requests.exceptions.Timeout, requests.exceptions.ConnectionError) as client_ex:
+        error_type = type(client_ex).__name__.replace("Error", " Fail").replace("Timeout", "Timeout")
+        LOGGER.warning("CalDAV %s for %s.", error_type, url_display_name)
+        errors.append({"time": "ERR", "title": f"{error_type}: {url_display_name[:20]}", "sort_key": today_start})
+    except Exception as client_ex:
+        LOGGER.warning("Unexpected CalDAV Error for %s: %s", url_display_name, client_ex)
+        LOGGER.debug("CalDAV client traceback for %s", url_display_name, exc_info=True)
+        errors.append({"time": "ERR", "title": f"CalLoad Fail: {url_display_name[:20]}", "sort_key": today_start})
+    return events, errors
 
 
 def _fetch_lat_lon(location_name, session):
@@ -190,20 +411,119 @@ def _fetch_lat_lon(location_name, session):
     try:
         response = session.get(API_OPEN_METEO_GEOCODE_URL, params=params, timeout=FETCH_WEATHER_TIMEOUT / 2)
         response.raise_for_status()
-        data = response.json()
+        data = _parse_json(response.content)
         if data and data.get("results"):
             result = data["results"][0]
             lat, lon = result.get("latitude"), result.get("longitude")
             if isinstance(lat, (int, float)) and isinstance(lon, (int, float)):
                 return lat, lon
-        print(f"Warning: Geocoding failed or returned invalid data for '{location_name}'.")
+        LOGGER.warning("Geocoding failed or returned invalid data for '%s'.", location_name)
     except requests.exceptions.RequestException as e:
-        print(f"Error during geocoding request for '{location_name}': {e}")
+        LOGGER.warning("Error during geocoding request for '%s': %s", location_name, e)
     except Exception as e:
-        print(f"Unexpected error during geocoding for '{location_name}': {e}")
+        LOGGER.warning("Unexpected error during geocoding for '%s': %s", location_name, e)
+        LOGGER.debug("Geocoding traceback for '%s'", location_name, exc_info=True)
     return None, None
 
 
+def _format_weather_strings(weather_info):
+    temp, high, low, humidity = weather_info.get("temp"), weather_info.get("high"), weather_info.get("low"), weather_info.get("humidity")
+    weather_info["temp_str"] = f"{temp:.0f}°C" if temp is not None else "--°C"
+    weather_info["hilo_str"] = f"H:{high:.0f}° L:{low:.0f}°" if high is not None and low is not None else "H:--° L:--°"
+    weather_info["hum_str"] = f"Hum: {humidity:.0f}%" if humidity is not None else "Hum: --%"
+
+
+def _get_png_render_page():
+    page, browser = getattr(PNG_RENDER_STATE, "page", None), getattr(PNG_RENDER_STATE, "browser", None)
+    if page and not page.is_closed() and browser and browser.is_connected():
+        return page
+    _close_png_renderer()
+    LOGGER.info("Launching Playwright browser for PNG rendering...")
+    PNG_RENDER_STATE.playwright = sync_playwright().start()
+    PNG_RENDER_STATE.browser = PNG_RENDER_STATE.playwright.chromium.launch(headless=True)
+    PNG_RENDER_STATE.context = PNG_RENDER_STATE.browser.new_context(device_scale_factor=1)
+    PNG_RENDER_STATE.page = PNG_RENDER_STATE.context.new_page()
+    PNG_RENDER_STATE.page.set_viewport_size(PNG_VIEWPORT_SIZE)
+    return PNG_RENDER_STATE.page
+
+
+def _load_app_snapshot():
+    global APP_DATA, PNG_CACHE
+    app_data, png_cache, render_fingerprints = {}, {}, {}
+    try:
+        snapshot = _parse_json(_read_private_file(APP_SNAPSHOT_PATH))
+        snapshot_age = time.time() - snapshot["saved_at"]
+        if snapshot_age > APP_SNAPSHOT_MAX_AGE_SECONDS:
+            LOGGER.info("Ignoring snapshot from %.0fs ago, it is too old to serve.", snapshot_age)
+            return False
+        for user_hash, snapshot_user in snapshot["users"].items():
+            if user_hash not in USER_HASHES:
+                continue
+            user_data = dict(snapshot_user["data"])
+            user_tz = user_data["timezone_obj"] = ZoneInfo(user_data["timezone_str"])
+            for events_key in ("today_events", "tomorrow_events"):
+                user_data[events_key] = [{**event, "sort_key": datetime.datetime.fromisoformat(event["sort_key"]).astimezone(user_tz)} if event.get("sort_key") else event for event in user_data[events_key]]
+            app_data[user_hash] = user_data
+            if snapshot_user["png"]:
+                png_base64, png_etag, rendered_at = snapshot_user["png"]
+                png_cache[user_hash] = (base64.b64decode(png_base64), png_etag, rendered_at)
+                if snapshot_user["fingerprint"]:
+                    render_fingerprints[user_hash] = bytes.fromhex(snapshot_user["fingerprint"])
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        LOGGER.warning("Could not load snapshot from %s: %s", APP_SNAPSHOT_PATH, e)
+        return False
+    if not app_data:
+        return False
+    with APP_DATA_LOCK:
+        APP_DATA = types.MappingProxyType({user_hash: types.MappingProxyType(user_data) for user_hash, user_data in app_data.items()})
+    with PNG_CACHE_LOCK:
+        PNG_CACHE = png_cache
+    RENDER_FINGERPRINTS.update(render_fingerprints)
+    LOGGER.info("Loaded snapshot from %.0fs ago for %s users.", snapshot_age, len(app_data))
+    return True
+
+
+def _load_geocode_cache():
+    try:
+        geocode_cache = _parse_json(_read_private_file(GEOCODE_CACHE_PATH))
+        if not isinstance(geocode_cache, dict):
+            raise TypeError(f"expected a JSON object, got {type(geocode_cache).__name__}")
+        GEOCODE_CACHE.update(geocode_cache)
+        LOGGER.info("Loaded %s cached geocoding results from %s.", len(GEOCODE_CACHE), GEOCODE_CACHE_PATH)
+    except FileNotFoundError:
+        pass
+    except (OSError, TypeError, ValueError) as e:
+        LOGGER.warning("Could not load geocoding cache from %s: %s", GEOCODE_CACHE_PATH, e)
+
+
+def _parse_event_cached(ics_hash, ics_data, user_tz):
+    cache_key = (ics_hash, user_tz.key)
+    with ICS_PARSE_CACHE_LOCK:
+        cached_result = ICS_PARSE_CACHE.get(cache_key)
+        if cached_result is not None:
+            ICS_PARSE_CACHE.move_to_end(cache_key)
+    if cached_result is not None:
+        details, is_all_day = cached_result
+        return (dict(details) if details else None), is_all_day
+    if isinstance(ics_data, bytes) and not ics_data.isascii():
+        try:
+            ics_data = ics_data.decode("utf-8")
+        except UnicodeDecodeError:
+            ics_data = ics_data.decode("latin-1", errors="replace")
+    details, is_all_day = _process_event_data(ics_data, user_tz)
+    with ICS_PARSE_CACHE_LOCK:
+        ICS_PARSE_CACHE[cache_key] = (details, is_all_day)
+        while len(ICS_PARSE_CACHE) > ICS_PARSE_CACHE_SIZE:
+            ICS_PARSE_CACHE.popitem(last=False)
+    return (dict(details) if details else None), is_all_day
+
+
+def _parse_json(content):
+    return orjson.loads(content) if orjson else json.loads(content)
+
+
 def _process_event_data(ics_data_str, user_tz):
     try:
         cal = Calendar.from_ical(ics_data_str)
@@ -224,10 +544,10 @@ def _process_event_data(ics_data_str, user_tz):
         event_start_local, time_str = None, "ERR"
         if is_all_day:
             naive_dt = datetime.datetime.combine(instance_start_time_obj, datetime.time.min)
-            event_start_local = user_tz.localize(naive_dt) if naive_dt.tzinfo is None else naive_dt.astimezone(user_tz)
+            event_start_local = naive_dt.replace(tzinfo=user_tz) if naive_dt.tzinfo is None else naive_dt.astimezone(user_tz)
             time_str = "All Day"
         elif isinstance(instance_start_time_obj, datetime.datetime):
-            event_start_local = instance_start_time_obj.astimezone(user_tz) if instance_start_time_obj.tzinfo else user_tz.localize(instance_start_time_obj)
+            event_start_local = instance_start_time_obj.astimezone(user_tz) if instance_start_time_obj.tzinfo else instance_start_time_obj.replace(tzinfo=user_tz)
             time_str = event_start_local.strftime("%H:%M")
         else:
             return None, None
@@ -235,134 +555,261 @@ def _process_event_data(ics_data_str, user_tz):
             return None, None
         return {"time": time_str, "title": summary, "sort_key": event_start_local, "uid": uid}, is_all_day
     except Exception as e:
-        print(f"         Error parsing single event data ({'Iterator Issue' if 'object is not an iterator' in str(e) else 'General'}): {e}")
+        LOGGER.warning("Error parsing single event data (%s): %s: %s", "Iterator Issue" if "object is not an iterator" in str(e) else "General", type(e).__name__, e)
         return None, None
 
 
+def _read_private_file(path):
+    with open(path, encoding="utf-8", opener=lambda file_path, flags: os.open(file_path, flags | os.O_NOFOLLOW)) as private_file:
+        file_stat = os.fstat(private_file.fileno())
+        if file_stat.st_uid != os.getuid() or file_stat.st_mode & 0o077:
+            raise PermissionError(f"{path} is not private to the current user")
+        return private_file.read()
+
+
+def _refresh_user_data(user_hash, config):
+    LOGGER.info("Refreshing data for user: %s", user_hash)
+    user_tz = config.timezone_obj
+    day_bounds = _day_bounds(user_tz, datetime.datetime.now(user_tz).date())
+    weather_info = _call_shared(("weather", config.weather_location.strip().lower(), config.timezone), fetch_weather_data, config.weather_location, config.timezone)
+    today_events, tomorrow_events = fetch_calendar_events(config.caldav_filters, config.caldav_urls, day_bounds, user_tz)
+    if weather_info:
+        weather_info = dict(weather_info)
+        weather_info["icon_class"] = get_weather_icon_class(weather_info.get("is_day", 1), weather_info.get("icon_code"))
+    else:
+        LOGGER.warning("Weather fetch failed for %s, using default placeholder.", user_hash)
+        weather_info = {"temp": None, "high": None, "low": None, "humidity": None, "icon_code": "unknown", "is_day": 1, "icon_class": get_weather_icon_class(1, "unknown")}
+    _format_weather_strings(weather_info)
+    last_updated = time.time()
+    return {
+        "last_updated": last_updated,
+        "last_updated_str": datetime.datetime.fromtimestamp(last_updated, tz=user_tz).strftime("%Y-%m-%d %H:%M:%S %Z"),
+        "timezone_obj": user_tz,
+        "timezone_str": config.timezone,
+        "today_events": today_events,
+        "tomorrow_events": tomorrow_events,
+        "weather": weather_info,
+    }
+
+
 def _regenerate_all_pngs(hashes_to_render):
     global PNG_CACHE
     if not hashes_to_render:
         return
-    print(f"  Starting PNG cache regeneration for {len(hashes_to_render)} users...")
-    start_png_time, generated_count, failed_count = time.time(), 0, 0
+    LOGGER.info("Starting PNG cache regeneration for %s users...", len(hashes_to_render))
+    start_png_time, generated_count, failed_count, skipped_count = time.monotonic(), 0, 0, 0
+    render_futures, rendered_pngs, render_fingerprints = {}, {}, {}
+    for user_hash in hashes_to_render:
+        user_data = APP_DATA.get(user_hash)
+        if not user_data or "timezone_obj" not in user_data:
+            LOGGER.info("Skipping PNG render for %s, essential data missing.", user_hash)
+            failed_count += 1
+            continue
+        try:
+            template_context = _build_template_context(user_hash, user_data)
+        except Exception as context_err:
+            LOGGER.warning("Error building template context for %s: %s", user_hash, context_err)
+            failed_count += 1
+            continue
+        render_fingerprint = _render_fingerprint(template_context)
+        if RENDER_FINGERPRINTS.get(user_hash) == render_fingerprint and user_hash in PNG_CACHE:
+            skipped_count += 1
+            continue
+        render_fingerprints[user_hash] = render_fingerprint
+        render_futures[user_hash] = PNG_RENDER_EXECUTOR.submit(_render_png_for_hash, user_hash, template_context)
+    for user_hash, future in render_futures.items():
+        png_data = future.result()
+        if png_data:
+            rendered_pngs[user_hash] = (png_data, hashlib.blake2b(png_data, digest_size=8).hexdigest(), time.time())
+            RENDER_FINGERPRINTS[user_hash] = render_fingerprints[user_hash]
+            generated_count += 1
+        else:
+            failed_count += 1
+    if rendered_pngs:
+        with PNG_CACHE_LOCK:
+            PNG_CACHE = {**PNG_CACHE, **rendered_pngs}
+    LOGGER.info("PNG regeneration finished. Generated: %s, Unchanged: %s, Failed: %s. Duration: %.2fs.", generated_count, skipped_count, failed_count, time.monotonic() - start_png_time)
 
-    playwright_instance_successfully_started = False
-    try:
-        with sync_playwright() as p:
-            playwright_instance_successfully_started = True
-            browser = None
-            context = None
-            page = None
-            try:
-                browser = p.chromium.launch(headless=True)
-                context = browser.new_context(device_scale_factor=1)
-                page = context.new_page()
-                page.set_viewport_size({"width": PNG_VIEWPORT_WIDTH, "height": PNG_VIEWPORT_HEIGHT})
-
-                for user_hash in hashes_to_render:
-                    with APP_DATA_LOCK:
-                        user_data_copy = APP_DATA.get(user_hash, {}).copy()
-
-                    if not user_data_copy or "timezone_obj" not in user_data_copy:
-                        print(f"    Skipping PNG render for {user_hash}, essential data missing.")
-                        failed_count += 1
-                        continue
-
-                    template_context = None
-                    try:
-                        template_context = _build_template_context(user_hash, user_data_copy)
-                    except Exception as context_err:
-                        print(f"    Error building template context for {user_hash}: {context_err}")
-                        failed_count += 1
-                        continue
-
-                    png_data = _render_png_for_hash(user_hash, page, template_context)
-                    if png_data:
-                        with PNG_CACHE_LOCK:
-                            PNG_CACHE[user_hash] = png_data
-                        generated_count += 1
-                    else:
-                        failed_count += 1
-
-            except PlaywrightError as e_pw_inner:
-                print(f"  Playwright Error during PNG generation process: {e_pw_inner}")
-                traceback.print_exc()
-                failed_count = len(hashes_to_render) - generated_count
-            except Exception as e_other_inner:
-                print(f"  Unexpected error during PNG generation process: {e_other_inner}")
-                traceback.print_exc()
-                failed_count = len(hashes_to_render) - generated_count
-            finally:
-                if page:
-                    try:
-                        page.close()
-                    except PlaywrightError as pe_page:
-                        print(f"    Error closing Playwright page: {pe_page}")
-                if context:
-                    try:
-                        context.close()
-                    except PlaywrightError as pe_context:
-                        print(f"    Error closing Playwright context: {pe_context}")
-                if browser:
-                    try:
-                        browser.close()
-                    except PlaywrightError as pe_browser:
-                        print(f"    Error closing Playwright browser: {pe_browser}")
-
-    except PlaywrightError as e_pw_outer:
-        print(f"  FATAL: Playwright failed to initialize or suffered a critical error: {e_pw_outer}")
-        traceback.print_exc()
-        if not playwright_instance_successfully_started:
-            failed_count = len(hashes_to_render)
-            generated_count = 0
-    except Exception as e_other_outer:
-        print(f"  FATAL: Unexpected error outside main Playwright block: {e_other_outer}")
-        traceback.print_exc()
-        if not playwright_instance_successfully_started:
-            failed_count = len(hashes_to_render)
-            generated_count = 0
-
-    print(f"  PNG regeneration finished. Generated: {generated_count}, Failed: {failed_count}. Duration: {time.time() - start_png_time:.2f}s.")
-
-
-def _render_png_for_hash(user_hash, page, template_context):
+
+def _render_fingerprint(template_context):
+    now_local, weather_info = template_context["now_local"], template_context["weather_info"]
+    today_events = [(event["time"], event["title"], event["time"] not in ("All Day", "ERR") and bool(event.get("sort_key")) and event["sort_key"] < now_local) for event in template_context["today_events"]]
+    tomorrow_events = [(event["time"], event["title"]) for event in template_context["tomorrow_events"]]
+    fingerprint_source = [template_context["today_date_header_str"], template_context["tomorrow_date_header_str"], [weather_info.get(key) for key in ("icon_class", "temp_str", "hilo_str", "hum_str")], today_events, tomorrow_events]
+    return hashlib.blake2b(json.dumps(fingerprint_source).encode("utf-8"), digest_size=16).digest()
+
+
+def _render_index_html(template_context):
+    user_hash = template_context["user_hash"]
+    render_key = (template_context["last_updated_str"], template_context["now_local"].replace(second=0, microsecond=0))
+    with HTML_RENDER_CACHE_LOCK:
+        cached_html = HTML_RENDER_CACHE.get(user_hash)
+    if cached_html and cached_html[0] == render_key:
+        return cached_html[1], cached_html[2]
+    with app.app_context():
+        html_string = (app.jinja_env.get_template("index.html") if app.debug else INDEX_TEMPLATE).render(**template_context)
+    html_etag = hashlib.blake2b(html_string.encode("utf-8"), digest_size=8).hexdigest()
+    with HTML_RENDER_CACHE_LOCK:
+        HTML_RENDER_CACHE[user_hash] = (render_key, html_string, html_etag)
+    return html_string, html_etag
+
+
+def _render_png_for_hash(user_hash, template_context):
     try:
-        with app.app_context():
-            html_string = render_template("index.html", **template_context)
-        page.set_content(html_string, wait_until="networkidle", timeout=PNG_TIMEOUT)
-        png_bytes = page.screenshot(type="png")
-        print(f"    Rendered PNG for {user_hash}")
+        html_string, _ = _render_index_html(template_context)
+        page = _get_png_render_page()
+        page.set_content(html_string, wait_until="load", timeout=PNG_TIMEOUT)
+        page.evaluate("() => document.fonts.ready.then(() => true)")
+        png_bytes = _convert_png_for_eink(page.screenshot(type="png"))
+        LOGGER.info("Rendered PNG for %s", user_hash)
         return png_bytes
-    except (PlaywrightError, Exception) as e:
-        print(f"    Error generating PNG for {user_hash}: {e}")
+    except PlaywrightTimeoutError as e:
+        LOGGER.warning("Timed out generating PNG for %s: %s", user_hash, e)
+    except PlaywrightError as e:
+        LOGGER.warning("Playwright Error generating PNG for %s: %s. Browser will be relaunched.", user_hash, e)
+        _close_png_renderer()
+    except Exception as e:
+        LOGGER.warning("Error generating PNG for %s: %s", user_hash, e)
     return None
 
 
+def _save_app_snapshot():
+    snapshot_users = {}
+    for user_hash, user_data in APP_DATA.items():
+        png_entry, fingerprint = PNG_CACHE.get(user_hash), RENDER_FINGERPRINTS.get(user_hash)
+        snapshot_users[user_hash] = {
+            "data": {key: value for key, value in user_data.items() if key != "timezone_obj"},
+            "fingerprint": fingerprint.hex() if fingerprint else None,
+            "png": [base64.b64encode(png_entry[0]).decode("ascii"), png_entry[1], png_entry[2]] if png_entry else None,
+        }
+    try:
+        _write_private_file(APP_SNAPSHOT_PATH, json.dumps({"saved_at": time.time(), "users": snapshot_users}, default=datetime.datetime.isoformat))
+    except (OSError, TypeError, ValueError) as e:
+        LOGGER.warning("Could not persist snapshot to %s: %s", APP_SNAPSHOT_PATH, e)
+
+
+def _save_geocode_cache():
+    try:
+        _write_private_file(GEOCODE_CACHE_PATH, json.dumps(GEOCODE_CACHE))
+    except OSError as e:
+        LOGGER.warning("Could not persist geocoding cache to %s: %s", GEOCODE_CACHE_PATH, e)
+
+
+def _search_calendar(calendar_obj, calendar_name, periods, user_tz, url_deadline):
+    events, errors = [], []
+    today_start, tomorrow_end = periods[0][1], periods[-1][2]
+    if not _apply_caldav_budget(calendar_obj.client, url_deadline):
+        LOGGER.warning("CalDAV budget exhausted before searching '%s', skipping it this cycle.", calendar_name)
+        errors.append({"time": "ERR", "title": f"CalTimeout: {calendar_name[:10]}", "sort_key": today_start})
+        return events, errors
+    excluded_dates_by_uid = {}
+    try:
+        wide_start = today_start - datetime.timedelta(days=365)
+        wide_end = tomorrow_end + datetime.timedelta(days=365)
+        potential_masters = calendar_obj.date_search(start=wide_start, end=wide_end, expand=False)
+        for event_stub in potential_masters:
+            cal = Calendar.from_ical(event_stub.data)
+            for comp in cal.walk("VEVENT"):
+                if comp.get("EXDATE"):
+                    uid = str(comp.get("uid"))
+                    if uid not in excluded_dates_by_uid:
+                        excluded_dates_by_uid[uid] = set()
+                    exdates_prop = comp.get("EXDATE")
+                    if not isinstance(exdates_prop, list):
+                        exdates_prop = [exdates_prop]
+                    for exdate_list in exdates_prop:
+                        for vdate in exdate_list.dts:
+                            dt = vdate.dt
+                            if isinstance(dt, datetime.datetime):
+                                dt_aware = dt.astimezone(user_tz) if dt.tzinfo else dt.replace(tzinfo=user_tz)
+                                excluded_dates_by_uid[uid].add(dt_aware.date())
+                            else:
+                                excluded_dates_by_uid[uid].add(dt)
+    except Exception as e:
+        LOGGER.warning("Could not build EXDATE blocklist for '%s': %s", calendar_name, e)
+    if not _apply_caldav_budget(calendar_obj.client, url_deadline):
+        LOGGER.warning("CalDAV budget exhausted before searching '%s', skipping it this cycle.", calendar_name)
+        errors.append({"time": "ERR", "title": f"CalTimeout: {calendar_name[:10]}", "sort_key": today_start})
+        return events, errors
+    seen_ics_hashes = set()
+    try:
+        results = calendar_obj.date_search(start=today_start, end=tomorrow_end, expand=True)
+        for event in results:
+            ics_data = getattr(event, "data", None)
+            if not ics_data:
+                continue
+            ics_hash = hashlib.blake2b(ics_data if isinstance(ics_data, bytes) else ics_data.encode("utf-8"), digest_size=16).digest()
+            if ics_hash in seen_ics_hashes:
+                continue
+            seen_ics_hashes.add(ics_hash)
+            details, is_all_day_event = _parse_event_cached(ics_hash, ics_data, user_tz)
+            if details and details.get("sort_key"):
+                event_start_dt = details["sort_key"]
+                event_uid = details.get("uid")
+                if event_uid in excluded_dates_by_uid and event_start_dt.date() in excluded_dates_by_uid[event_uid]:
+                    continue
+                for event_period, event_period_start, event_period_end in periods:
+                    if event_period_start <= event_start_dt < event_period_end:
+                        events.append((event_period, details, is_all_day_event))
+                        break
+    except Exception as search_ex:
+        LOGGER.warning("Error searching '%s': %s", calendar_name, search_ex)
+        errors.append({"time": "ERR", "title": f"CalSearchFail: {calendar_name[:10]}", "sort_key": today_start})
+    return events, errors
+
+
+def _stop_background_refresh():
+    SHUTDOWN_EVENT.set()
+    REFRESH_TRIGGER.set()
+
+
+def _write_private_file(path, content):
+    file_descriptor, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{os.path.basename(path)}.")
+    try:
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as private_file:
+            private_file.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
 # ==============================================================================
 # Background Task
 # ==============================================================================
 def background_refresh_loop():
-    print(f"Background refresh thread started. Will aim to refresh data around HH:{TARGET_REFRESH_MINUTE:02d} UTC.")
-    time.sleep(10)
-    while True:
+    LOGGER.info("Background refresh thread started. Will aim to refresh data around HH:%02d UTC.", TARGET_REFRESH_MINUTE)
+    failure_count = 0
+    while not SHUTDOWN_EVENT.is_set():
         now_utc = datetime.datetime.now(datetime.UTC)
-        next_refresh_time_utc = now_utc.replace(minute=TARGET_REFRESH_MINUTE, second=0, microsecond=0)
-        if now_utc.minute >= TARGET_REFRESH_MINUTE:
-            next_refresh_time_utc += datetime.timedelta(hours=1)
-        sleep_duration_seconds = (next_refresh_time_utc - now_utc).total_seconds()
-        if sleep_duration_seconds < 0:
-            sleep_duration_seconds = 5
-            print(f"Warning: Calculated sleep duration is negative ({sleep_duration_seconds}s). Fallback to 5s sleep.")
-        print(f"Background thread: Current UTC is {now_utc.strftime('%Y-%m-%d %H:%M:%S')}. Next refresh at {next_refresh_time_utc.strftime('%Y-%m-%d %H:%M:%S')} UTC. Sleeping for {sleep_duration_seconds:.2f}s.")
-        time.sleep(sleep_duration_seconds)
-        print(f"Background thread: Woke up at {datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S')}. Triggering data refresh.")
+        if failure_count:
+            sleep_duration_seconds = min(REFRESH_RETRY_MAX_SECONDS, 2**failure_count * 5 + random.uniform(0, 5))
+            LOGGER.warning("Background thread: Refresh failed %d time(s) in a row. Retrying in %.2fs.", failure_count, sleep_duration_seconds)
+        else:
+            next_refresh_time_utc = now_utc.replace(minute=TARGET_REFRESH_MINUTE, second=0, microsecond=0)
+            if now_utc.minute >= TARGET_REFRESH_MINUTE:
+                next_refresh_time_utc += datetime.timedelta(hours=1)
+            sleep_duration_seconds = (next_refresh_time_utc - now_utc).total_seconds()
+            if sleep_duration_seconds < 0:
+                sleep_duration_seconds = 5
+                LOGGER.warning("Calculated sleep duration is negative. Fallback to %ss sleep.", sleep_duration_seconds)
+            LOGGER.info("Background thread: Current UTC is %s. Next refresh at %s UTC. Sleeping for %.2fs.", now_utc.strftime("%Y-%m-%d %H:%M:%S"), next_refresh_time_utc.strftime("%Y-%m-%d %H:%M:%S"), sleep_duration_seconds)
+        REFRESH_TRIGGER.wait(sleep_duration_seconds)
+        REFRESH_TRIGGER.clear()
+        if SHUTDOWN_EVENT.is_set():
+            break
+        LOGGER.info("Background thread: Woke up at %s. Triggering data refresh.", datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%d %H:%M:%S"))
+        REFRESH_IN_PROGRESS.set()
         try:
             refresh_all_data()
+            failure_count = 0
         except Exception as e:
-            print(f"ERROR in background_refresh_loop during refresh_all_data: {e}")
-            traceback.print_exc()
-            print("An error occurred during data refresh. Waiting for 60 seconds before next attempt.")
-            time.sleep(60)
+            failure_count += 1
+            LOGGER.error("ERROR in background_refresh_loop during refresh_all_data: %s", e)
+            LOGGER.debug("Background refresh traceback", exc_info=True)
+        finally:
+            REFRESH_IN_PROGRESS.clear()
+    LOGGER.info("Background refresh thread stopped.")
 
 
 # ==============================================================================
@@ -375,241 +822,182 @@ def default_route():
 
 @app.route("/<user_hash>")
 def display_page(user_hash):
-    if user_hash not in USER_CONFIG:
+    if user_hash not in USER_HASHES:
         abort(404, description=f"User '{user_hash}' not found or not configured.")
-    with APP_DATA_LOCK:
-        user_data = APP_DATA.get(user_hash, {}).copy()
+    user_data = APP_DATA.get(user_hash)
     if not user_data or "timezone_obj" not in user_data or "last_updated" not in user_data:
-        print(f"Data not ready for user '{user_hash}'. Current APP_DATA keys: {list(APP_DATA.keys())}")
+        LOGGER.warning("Data not ready for user '%s'. Current APP_DATA keys: %s", user_hash, list(APP_DATA.keys()))
         abort(503, description="Data for this user is currently unavailable. Please try again shortly.")
     try:
         template_context = _build_template_context(user_hash, user_data)
-        return render_template("index.html", **template_context)
+        html_string, html_etag = _render_index_html(template_context)
+        response = Response(html_string, mimetype="text/html")
+        response.set_etag(html_etag)
+        return response.make_conditional(request)
     except Exception as e:
-        print(f"Error during template rendering for user '{user_hash}': {e}")
-        traceback.print_exc()
+        LOGGER.warning("Error during template rendering for user '%s': %s: %s", user_hash, type(e).__name__, e)
+        LOGGER.debug("Template rendering traceback for '%s'", user_hash, exc_info=True)
         abort(500, description="Internal error rendering display page.")
 
 
 @app.route("/<user_hash>.png")
 def display_page_png(user_hash):
-    if user_hash not in USER_CONFIG:
+    if user_hash not in USER_HASHES:
         abort(404, description=f"User '{user_hash}' not found or not configured.")
-    with PNG_CACHE_LOCK:
-        png_bytes = PNG_CACHE.get(user_hash)
-    if png_bytes:
-        return Response(png_bytes, mimetype="image/png")
+    cached_png = PNG_CACHE.get(user_hash)
+    if cached_png:
+        png_bytes, png_etag, png_rendered_at = cached_png
+        response = Response(png_bytes, mimetype="image/png", headers={"Cache-Control": PNG_CACHE_CONTROL})
+        response.set_etag(png_etag)
+        response.last_modified = png_rendered_at
+        return response.make_conditional(request)
     else:
-        with APP_DATA_LOCK:
-            data_should_exist = user_hash in APP_DATA and APP_DATA[user_hash] is not None
+        data_should_exist = APP_DATA.get(user_hash) is not None
         if data_should_exist:
-            print(f"PNG not found in cache for '{user_hash}', but data exists. Possible render issue.")
+            LOGGER.warning("PNG not found in cache for '%s', but data exists. Possible render issue.", user_hash)
             abort(500, description="PNG image is currently unavailable (possible rendering error). Please try again shortly.")
         else:
-            print(f"PNG not found in cache for '{user_hash}', and underlying data is also missing.")
+            LOGGER.warning("PNG not found in cache for '%s', and underlying data is also missing.", user_hash)
             abort(503, description="Data and PNG image are currently unavailable. Please try again shortly.")
 
 
+@app.route("/_admin/refresh", methods=["POST"])
+def trigger_refresh():
+    if not ADMIN_TOKEN:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+        abort(401, description="Missing or invalid admin token.")
+    if not USER_CONFIG:
+        abort(503, description="No users configured.")
+    if REFRESH_IN_PROGRESS.is_set():
+        return "Refresh already in progress, try again later", 429, {"Content-Type": "text/plain", "Retry-After": str(REFRESH_TRIGGER_MIN_SECONDS)}
+    seconds_since_refresh = time.monotonic() - LAST_REFRESH_MONOTONIC
+    if seconds_since_refresh < REFRESH_TRIGGER_MIN_SECONDS:
+        return "Refresh ran recently, try again later", 429, {"Content-Type": "text/plain", "Retry-After": str(int(REFRESH_TRIGGER_MIN_SECONDS - seconds_since_refresh) + 1)}
+    REFRESH_TRIGGER.set()
+    return "Refresh triggered", 202, {"Content-Type": "text/plain"}
+
+
 # ==============================================================================
 # Core Data Fetching Logic
 # ==============================================================================
-def fetch_calendar_events(caldav_filters, caldav_urls, start_date_local, user_tz):
-    all_today, timed_today, all_tomorrow, timed_tomorrow, errors = [], [], [], [], []
-    added_all_today_titles, added_timed_today_keys = set(), set()
-    added_all_tomorrow_titles, added_timed_tomorrow_keys = set(), set()
-    today_start, today_end = start_date_local, start_date_local + datetime.timedelta(days=1)
-    tomorrow_start, tomorrow_end = today_end, today_end + datetime.timedelta(days=1)
+def fetch_calendar_events(caldav_filters, caldav_urls, day_bounds, user_tz):
+    errors = []
+    today_start, today_end, tomorrow_start, tomorrow_end = day_bounds
     if not caldav_urls:
         return [], []
-    for url in caldav_urls:
-        username, password, url_display_name = None, None, url
-        try:
-            parsed_url = urllib.parse.urlparse(url)
-            url_display_name = parsed_url.hostname if parsed_url.hostname else url
-            username = urllib.parse.unquote(parsed_url.username) if parsed_url.username else None
-            password = urllib.parse.unquote(parsed_url.password) if parsed_url.password else None
-            url_no_creds = parsed_url._replace(netloc=parsed_url.hostname + (f":{parsed_url.port}" if parsed_url.port else "")).geturl()
-            with caldav.DAVClient(url=url_no_creds, username=username, password=password, timeout=FETCH_CALDAV_TIMEOUT) as client:
-                principal = client.principal()
-                calendars = principal.calendars()
-                if not calendars:
-                    print(f"         No calendars found for principal at {url_display_name}.")
-                    continue
-                for calendar_obj in calendars:
-                    try:
-                        calendar_name = getattr(calendar_obj, "name", "Unknown Calendar") or "Unknown Calendar"
-                    except Exception as cal_name_ex:
-                        calendar_name = f"Unknown(NameErr: {cal_name_ex})"
-                    if caldav_filters and calendar_name.lower() not in caldav_filters:
-                        continue
-                    excluded_dates_by_uid = {}
-                    try:
-                        wide_start = today_start - datetime.timedelta(days=365)
-                        wide_end = tomorrow_end + datetime.timedelta(days=365)
-                        potential_masters = calendar_obj.date_search(start=wide_start, end=wide_end, expand=False)
-                        for event_stub in potential_masters:
-                            cal = Calendar.from_ical(event_stub.data)
-                            for comp in cal.walk("VEVENT"):
-                                if comp.get("EXDATE"):
-                                    uid = str(comp.get("uid"))
-                                    if uid not in excluded_dates_by_uid:
-                                        excluded_dates_by_uid[uid] = set()
-                                    exdates_prop = comp.get("EXDATE")
-                                    if not isinstance(exdates_prop, list):
-                                        exdates_prop = [exdates_prop]
-                                    for exdate_list in exdates_prop:
-                                        for vdate in exdate_list.dts:
-                                            dt = vdate.dt
-                                            if isinstance(dt, datetime.datetime):
-                                                dt_aware = dt.astimezone(user_tz) if dt.tzinfo else user_tz.localize(dt)
-                                                excluded_dates_by_uid[uid].add(dt_aware.date())
-                                            else:
-                                                excluded_dates_by_uid[uid].add(dt)
-                    except Exception as e:
-                        print(f"               Warning: Could not build EXDATE blocklist for '{calendar_name}': {e}")
-                    for day_period, period_start, period_end, all_day_list, timed_list, added_all_day, added_timed in [("TODAY", today_start, today_end, all_today, timed_today, added_all_today_titles, added_timed_today_keys), ("TOMORROW", tomorrow_start, tomorrow_end, all_tomorrow, timed_tomorrow, added_all_tomorrow_titles, added_timed_tomorrow_keys)]:
-                        try:
-                            results = calendar_obj.date_search(start=period_start, end=period_end, expand=True)
-                            for event in results:
-                                if not hasattr(event, "data") or not event.data:
-                                    continue
-                                ics_data = event.data
-                                if isinstance(ics_data, bytes):
-                                    try:
-                                        ics_data = ics_data.decode("utf-8")
-                                    except UnicodeDecodeError:
-                                        ics_data = ics_data.decode("latin-1", errors="replace")
-                                details, is_all_day_event = _process_event_data(ics_data, user_tz)
-                                if details and details.get("sort_key"):
-                                    event_start_dt = details["sort_key"]
-                                    event_uid = details.get("uid")
-                                    if event_uid in excluded_dates_by_uid and event_start_dt.date() in excluded_dates_by_uid[event_uid]:
-                                        continue
-                                    if period_start <= event_start_dt < period_end:
-                                        summary = details["title"]
-                                        if is_all_day_event:
-                                            if summary not in added_all_day:
-                                                all_day_list.append(details)
-                                                added_all_day.add(summary)
-                                        else:
-                                            key = (details["time"], summary)
-                                            if key not in added_timed:
-                                                timed_list.append(details)
-                                                added_timed.add(key)
-                        except Exception as search_ex:
-                            print(f"               Error searching '{calendar_name}' for {day_period}: {search_ex}")
-                            if day_period == "TODAY":
-                                errors.append({"time": "ERR", "title": f"CalSearchFail {day_period}: {calendar_name[:10]}", "sort_key": today_start})
-        except (caldav.lib.error.AuthorizationError, requests.exceptions.Timeout, requests.exceptions.ConnectionError) as client_ex:
-            error_type = type(client_ex).__name__.replace("Error", " Fail").replace("Timeout", "Timeout")
-            print(f"         CalDAV {error_type} for {url_display_name}.")
-            errors.append({"time": "ERR", "title": f"{error_type}: {url_display_name[:20]}", "sort_key": today_start})
-        except Exception as client_ex:
-            print(f"         Unexpected CalDAV Error for {url_display_name}: {client_ex}")
-            traceback.print_exc()
-            errors.append({"time": "ERR", "title": f"CalLoad Fail: {url_display_name[:20]}", "sort_key": today_start})
-    timed_today.sort(key=lambda x: x["sort_key"])
-    all_today.sort(key=lambda x: x["title"])
-    timed_tomorrow.sort(key=lambda x: x["sort_key"])
-    all_tomorrow.sort(key=lambda x: x["title"])
+    periods = [("TODAY", today_start, today_end), ("TOMORROW", tomorrow_start, tomorrow_end)]
+    period_buckets = {"TODAY": ({}, {}), "TOMORROW": ({}, {})}
+    with ThreadPoolExecutor(max_workers=min(len(caldav_urls), FETCH_CALDAV_MAX_WORKERS), thread_name_prefix="CalDAVFetch") as executor:
+        futures = [executor.submit(_call_shared, ("caldav", url, caldav_filters, tuple(periods), user_tz), _fetch_caldav_events, url, caldav_filters, periods, user_tz) for url in caldav_urls]
+        url_results = [future.result() for future in futures]
+    for url_events, url_errors in url_results:
+        errors.extend(url_errors)
+        for day_period, details, is_all_day_event in url_events:
+            all_day_bucket, timed_bucket = period_buckets[day_period]
+            if is_all_day_event:
+                all_day_bucket.setdefault(details["title"], details)
+            else:
+                timed_bucket.setdefault((details["time"], details["title"]), details)
+    all_today, timed_today = sorted(period_buckets["TODAY"][0].values(), key=itemgetter("title")), sorted(period_buckets["TODAY"][1].values(), key=itemgetter("sort_key"))
+    all_tomorrow, timed_tomorrow = sorted(period_buckets["TOMORROW"][0].values(), key=itemgetter("title")), sorted(period_buckets["TOMORROW"][1].values(), key=itemgetter("sort_key"))
     return errors + all_today + timed_today, all_tomorrow + timed_tomorrow
 
 
 def fetch_weather_data(location, timezone_str):
     weather_data = {"temp": None, "high": None, "low": None, "humidity": None, "icon_code": "unknown", "is_day": 1}
-    with requests.Session() as session:
-        lat, lon = _fetch_lat_lon(location, session)
-        if lat is None or lon is None:
-            print(f"      Weather fetch failed for '{location}': Could not get coordinates.")
-            return None
-        params = {
-            "latitude": lat,
-            "longitude": lon,
-            "timezone": timezone_str,
-            "current": "temperature_2m,relative_humidity_2m,is_day,weather_code",
-            "daily": "weather_code,temperature_2m_max,temperature_2m_min",
-            "forecast_days": 1,
-        }
-        try:
-            response = session.get(API_OPEN_METEO_FORECAST_URL, params=params, timeout=FETCH_WEATHER_TIMEOUT)
+    lat, lon = _cached_lat_lon(location, HTTP_SESSION)
+    if lat is None or lon is None:
+        LOGGER.warning("Weather fetch failed for '%s': Could not get coordinates.", location)
+        return None
+    params = {
+        "latitude": lat,
+        "longitude": lon,
+        "timezone": timezone_str,
+        "current": "temperature_2m,relative_humidity_2m,is_day,weather_code",
+        "daily": "weather_code,temperature_2m_max,temperature_2m_min",
+        "forecast_days": 1,
+    }
+    try:
+        forecast_key = (lat, lon, timezone_str)
+        with FORECAST_CACHE_LOCK:
+            cached_forecast = FORECAST_CACHE.get(forecast_key)
+        request_headers = cached_forecast[0] if cached_forecast else None
+        response = HTTP_SESSION.get(API_OPEN_METEO_FORECAST_URL, params=params, headers=request_headers, timeout=FETCH_WEATHER_TIMEOUT)
+        if response.status_code == 304 and cached_forecast:
+            LOGGER.info("Open-Meteo forecast for '%s' not modified, reusing cached response.", location)
+            data = cached_forecast[1]
+        else:
             response.raise_for_status()
-            data = response.json()
-            current, daily = data.get("current", {}), data.get("daily", {})
-            weather_data.update({"temp": current.get("temperature_2m"), "humidity": current.get("relative_humidity_2m"), "icon_code": current.get("weather_code", "unknown"), "is_day": current.get("is_day", 1), "high": daily.get("temperature_2m_max", [None])[0], "low": daily.get("temperature_2m_min", [None])[0]})
-            if weather_data["icon_code"] is None or weather_data["icon_code"] == "unknown":
-                daily_codes = daily.get("weather_code", [None])
-                weather_data["icon_code"] = daily_codes[0] if daily_codes and daily_codes[0] is not None else "unknown"
-            for key in ["temp", "high", "low", "humidity"]:
-                if weather_data[key] is not None and not isinstance(weather_data[key], (int, float)):
-                    print(f"        Warning: Weather data '{key}' for '{location}' not num: {weather_data[key]}. Set to None.")
-                    weather_data[key] = None
-            if not isinstance(weather_data.get("is_day"), int) or weather_data.get("is_day") not in [0, 1]:
-                weather_data["is_day"] = 1
-            current_icon_code = weather_data.get("icon_code")
-            if current_icon_code not in [None, "unknown"]:
-                try:
-                    weather_data["icon_code"] = int(current_icon_code)
-                except (ValueError, TypeError):
-                    weather_data["icon_code"] = "unknown"
-            elif current_icon_code is None:
+            data = _parse_json(response.content)
+            validators = {}
+            if response.headers.get("ETag"):
+                validators["If-None-Match"] = response.headers["ETag"]
+            if response.headers.get("Last-Modified"):
+                validators["If-Modified-Since"] = response.headers["Last-Modified"]
+            if validators:
+                with FORECAST_CACHE_LOCK:
+                    FORECAST_CACHE[forecast_key] = (validators, data)
+        current, daily = data.get("current", {}), data.get("daily", {})
+        weather_data.update({"temp": current.get("temperature_2m"), "humidity": current.get("relative_humidity_2m"), "icon_code": current.get("weather_code", "unknown"), "is_day": current.get("is_day", 1), "high": daily.get("temperature_2m_max", [None])[0], "low": daily.get("temperature_2m_min", [None])[0]})
+        if weather_data["icon_code"] is None or weather_data["icon_code"] == "unknown":
+            daily_codes = daily.get("weather_code", [None])
+            weather_data["icon_code"] = daily_codes[0] if daily_codes and daily_codes[0] is not None else "unknown"
+        for key in ["temp", "high", "low", "humidity"]:
+            if weather_data[key] is not None and not isinstance(weather_data[key], (int, float)):
+                LOGGER.warning("Weather data '%s' for '%s' not num: %s. Set to None.", key, location, weather_data[key])
+                weather_data[key] = None
+        if not isinstance(weather_data.get("is_day"), int) or weather_data.get("is_day") not in [0, 1]:
+            weather_data["is_day"] = 1
+        current_icon_code = weather_data.get("icon_code")
+        if current_icon_code not in [None, "unknown"]:
+            try:
+                weather_data["icon_code"] = int(current_icon_code)
+            except (ValueError, TypeError):
                 weather_data["icon_code"] = "unknown"
-            return weather_data
-        except requests.exceptions.RequestException as e:
-            print(f"      Error during Open-Meteo request for '{location}': {e}")
-        except (KeyError, IndexError, ValueError, TypeError) as e:
-            print(f"      Error processing Open-Meteo response for '{location}': {e}")
-        except Exception as e:
-            print(f"      Unexpected error processing Open-Meteo forecast for '{location}': {e}")
-            traceback.print_exc()
+        elif current_icon_code is None:
+            weather_data["icon_code"] = "unknown"
+        return weather_data
+    except requests.exceptions.RequestException as e:
+        LOGGER.warning("Error during Open-Meteo request for '%s': %s", location, e)
+    except (KeyError, IndexError, ValueError, TypeError) as e:
+        LOGGER.warning("Error processing Open-Meteo response for '%s': %s", location, e)
+    except Exception as e:
+        LOGGER.warning("Unexpected error processing Open-Meteo forecast for '%s': %s", location, e)
+        LOGGER.debug("Open-Meteo forecast traceback for '%s'", location, exc_info=True)
     return None
 
 
 def get_weather_icon_class(is_day, wmo_code):
-    lookup_code = wmo_code if isinstance(wmo_code, int) else "unknown"
-    icon_map = WEATHER_ICON_CLASS_MAP_NIGHT if is_day == 0 else WEATHER_ICON_CLASS_MAP_DAY
-    return icon_map.get(lookup_code, WEATHER_ICON_CLASS_MAP_DAY.get(lookup_code, WEATHER_ICON_CLASS_MAP_DAY["unknown"]))
+    icon_classes = WEATHER_ICON_CLASSES_NIGHT if is_day == 0 else WEATHER_ICON_CLASSES_DAY
+    return icon_classes[wmo_code] if isinstance(wmo_code, int) and 0 <= wmo_code < len(icon_classes) else WEATHER_ICON_CLASS_MAP_DAY["unknown"]
 
 
 def refresh_all_data():
-    global APP_DATA
-    print("Starting data refresh cycle...")
-    new_user_data_map, start_time, hashes_requiring_png_render = {}, time.time(), []
+    global APP_DATA, LAST_REFRESH_MONOTONIC
+    LOGGER.info("Starting data refresh cycle...")
+    new_user_data_map, start_time, hashes_requiring_png_render = {}, time.monotonic(), []
     if not USER_CONFIG:
-        print("No users configured. Skipping data refresh.")
+        LOGGER.info("No users configured. Skipping data refresh.")
         return
-    for user_hash, config in USER_CONFIG.items():
-        print(f"  Refreshing data for user: {user_hash}")
+    with ThreadPoolExecutor(max_workers=min(len(USER_CONFIG), REFRESH_MAX_WORKERS), thread_name_prefix="RefreshUser") as executor:
+        futures = {user_hash: executor.submit(_refresh_user_data, user_hash, config) for user_hash, config in USER_CONFIG.items()}
+    for user_hash, future in futures.items():
         try:
-            user_tz = config["timezone_obj"]
-            now_local = datetime.datetime.now(user_tz)
-            start_of_today_local = now_local.replace(hour=0, minute=0, second=0, microsecond=0)
-            weather_info = fetch_weather_data(config["weather_location"], config["timezone"])
-            today_events, tomorrow_events = fetch_calendar_events(config.get("caldav_filters"), config.get("caldav_urls", []), start_of_today_local, user_tz)
-            if weather_info:
-                weather_info["icon_class"] = get_weather_icon_class(weather_info.get("is_day", 1), weather_info.get("icon_code"))
-            else:
-                print(f"    Weather fetch failed for {user_hash}, using default placeholder.")
-                weather_info = {"temp": None, "high": None, "low": None, "humidity": None, "icon_code": "unknown", "is_day": 1, "icon_class": get_weather_icon_class(1, "unknown")}
-            new_user_data_map[user_hash] = {
-                "last_updated": time.time(),
-                "timezone_obj": user_tz,
-                "timezone_str": config["timezone"],
-                "today_events": today_events,
-                "tomorrow_events": tomorrow_events,
-                "weather": weather_info,
-            }
+            new_user_data_map[user_hash] = future.result()
             hashes_requiring_png_render.append(user_hash)
-        except Exception as e:
-            print(f"  Unexpected error refreshing data for user {user_hash}: {e}")
-            traceback.print_exc()
+        except Exception:
+            LOGGER.exception("Unexpected error refreshing data for user %s", user_hash)
     with APP_DATA_LOCK:
-        APP_DATA = new_user_data_map
-        print("Global APP_DATA updated.")
+        APP_DATA = types.MappingProxyType({user_hash: types.MappingProxyType(user_data) for user_hash, user_data in new_user_data_map.items()})
+        LOGGER.info("Global APP_DATA updated.")
     if hashes_requiring_png_render:
         _regenerate_all_pngs(hashes_requiring_png_render)
+        _save_app_snapshot()
     else:
-        print("No users had data successfully refreshed or no users to refresh. PNG regeneration skipped.")
-    print(f"Data refresh cycle finished. Duration: {time.time() - start_time:.2f}s.")
+        LOGGER.info("No users had data successfully refreshed or no users to refresh. PNG regeneration skipped.")
+    LAST_REFRESH_MONOTONIC = time.monotonic()
+    LOGGER.info("Data refresh cycle finished. Duration: %.2fs.", LAST_REFRESH_MONOTONIC - start_time)
 
 
 # ==============================================================================
@@ -624,41 +1012,45 @@ def initialize_app_and_background_tasks():
     with _app_initialization_lock:
         if _app_tasks_initialized:
             return
-        print("Performing one-time application initialization...")
-        refresh_all_data()
-        print("Initial data load complete.")
+        LOGGER.info("Performing one-time application initialization...")
+        _load_geocode_cache()
         if USER_CONFIG:
-            print("Starting background refresh loop thread...")
+            if _load_app_snapshot():
+                LOGGER.info("Serving the snapshot until the background thread completes the first refresh.")
+            else:
+                LOGGER.info("No usable snapshot. User pages return 503 until the background thread completes the first refresh.")
+            REFRESH_TRIGGER.set()
+            LOGGER.info("Starting background refresh loop thread...")
             refresh_thread = threading.Thread(target=background_refresh_loop, daemon=True, name="BackgroundRefreshLoopThread")
             refresh_thread.start()
-            print("Background refresh loop thread started.")
+            atexit.register(_stop_background_refresh)
+            LOGGER.info("Background refresh loop thread started.")
         else:
-            print("Warning: No users configured. Background refresh thread not started.")
+            LOGGER.warning("No users configured. Background refresh thread not started.")
         _app_tasks_initialized = True
-        print("One-time application initialization complete.")
+        LOGGER.info("One-time application initialization complete.")
 
 
 # ==============================================================================
 # Main Execution Block (for Development & Gunicorn)
 # ==============================================================================
-if os.environ.get("WERKZEUG_RUN_MAIN") == "true" or not app.debug:
+if ENV.get("WERKZEUG_RUN_MAIN") == "true" or not app.debug:
     initialize_app_and_background_tasks()
-elif __name__ == "__main__" and app.debug and os.environ.get("WERKZEUG_RUN_MAIN") != "true":
-    print("Flask Dev Server Reloader (Main Monitor Process): Skipping initialization here.")
-    pass
+elif __name__ == "__main__" and app.debug and ENV.get("WERKZEUG_RUN_MAIN") != "true":
+    LOGGER.info("Flask Dev Server Reloader (Main Monitor Process): Skipping initialization here.")
 
 
 if __name__ == "__main__":
-    print("-" * 60)
-    print("Starting Flask development server...")
+    LOGGER.info("-" * 60)
+    LOGGER.info("Starting Flask development server...")
     if USER_CONFIG:
-        print("Available user endpoints (approximate for dev server):")
+        LOGGER.info("Available user endpoints (approximate for dev server):")
         for user_hash_key in USER_CONFIG.keys():
-            print(f"  HTML: http://127.0.0.1:7777/{user_hash_key}")
-            print(f"  PNG:  http://127.0.0.1:7777/{user_hash_key}.png")
+            LOGGER.info("HTML: http://127.0.0.1:7777/%s", user_hash_key)
+            LOGGER.info("PNG:  http://127.0.0.1:7777/%s.png", user_hash_key)
     else:
-        print("No users configured. Server will run but no user-specific data will be available.")
-    print("Note: Use a WSGI server (e.g., Gunicorn) for production deployments.")
-    print("If using Flask dev server with reloader, initialization happens in the reloaded process.")
-    print("-" * 60)
-    app.run(debug=True, host="0.0.0.0", port=7777, use_reloader=True)
+        LOGGER.info("No users configured. Server will run but no user-specific data will be available.")
+    LOGGER.info("Note: Use a WSGI server (e.g., Gunicorn) for production deployments.")
+    LOGGER.info("Set FLASK_DEBUG=1 to enable the debugger and reloader; initialization then happens in the reloaded process.")
+    LOGGER.info("-" * 60)
+    app.run(debug=app.debug, host="0.0.0.0", port=7777, use_reloader=app.debug)
@@ -0,0 +1,18 @@
+# ==============================================================================
+# Gunicorn Configuration
+# ==============================================================================
+import sys
+
+# A single process keeps one copy of APP_DATA, PNG_CACHE and the Playwright
+# browsers; threads serve concurrent display polls from the shared caches.
+bind = "0.0.0.0:7777"
+threads = 8
+worker_class = "gthread"
+workers = 1
+
+
+def worker_exit(server, worker):
+    # Wake the background refresh loop so it stops with the worker instead of sleeping through shutdown.
+    stop_background_refresh = getattr(sys.modules.get("app"), "_stop_background_refresh", None)
+    if stop_background_refresh is not None:
+        stop_background_refresh()